@@ -1,11 +1,19 @@
 import boto3
-import datetime
+from datetime import datetime, timedelta, timezone
 import json
+import logging
+import os
+import time
+import numpy as np
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # Script to retrieve FSx for ONTAP cluster management IP, SVM iSCSI IP, and inter-cluster IP
 # for SVM named "SVM1" from the least utilized file system (by IOPS and capacity) with tag myid=id111111
 
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
 # Variables
 SVM_NAME = "SVM1"
 AWS_REGION = "us-east-1"  # Replace with your AWS region
@@ -13,134 +21,184 @@ OUTPUT_FILE = "fsx_ontap_ips.txt"
 TAG_KEY = "myid"
 TAG_VALUE = "id111111"
 PERIOD = 3600  # Period for CloudWatch metrics (1 hour in seconds)
-END_TIME = datetime.datetime.utcnow()
-START_TIME = END_TIME - datetime.timedelta(seconds=3600)
+METRIC_DATA_BATCH_SIZE = 500  # Maximum MetricDataQueries per GetMetricData call
+DESCRIBE_BATCH_SIZE = 50  # Maximum FileSystemIds per DescribeFileSystems call
+END_TIME = datetime.now(timezone.utc)
+START_TIME = END_TIME - timedelta(seconds=PERIOD)
 IOPS_WEIGHT = 0.5  # Weight for IOPS in combined utilization score
 CAPACITY_WEIGHT = 0.5  # Weight for capacity in combined utilization score
-
-# Initialize AWS clients
-fsx_client = boto3.client('fsx', region_name=AWS_REGION)
-cloudwatch_client = boto3.client('cloudwatch', region_name=AWS_REGION)
+SVM_CACHE_DIR = os.path.expanduser("~/.cache/fsx_ontap_ips")  # Local cache for SVM details
+SVM_CACHE_TTL = 600  # Seconds before cached SVM details are refreshed (10 minutes)
+
+# Initialize AWS clients with adaptive retries (backoff with jitter on throttling) and TCP keepalive
+cfg = Config(
+    region_name=AWS_REGION,
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+    tcp_keepalive=True,
+    max_pool_connections=32
+)
+fsx_client = boto3.client('fsx', config=cfg)
+cloudwatch_client = boto3.client('cloudwatch', config=cfg)
+tag_client = boto3.client('resourcegroupstaggingapi', config=cfg)
 
 # Step 1: Get FSx for ONTAP file systems with the specified tag
-print(f"Retrieving FSx for ONTAP file systems with tag {TAG_KEY}={TAG_VALUE}...")
+log.info("Retrieving FSx for ONTAP file systems with tag %s=%s...", TAG_KEY, TAG_VALUE)
 try:
-    response = fsx_client.describe_file_systems(
-        Filters=[{'Name': 'file-system-type', 'Values': ['ONTAP']}]
-    )
-    file_systems = [
-        {
-            'FileSystemId': fs['FileSystemId'],
-            'ConsumedStorageCapacity': fs.get('OntapConfiguration', {}).get('ConsumedStorageCapacity', 0),
-            'StorageCapacity': fs.get('StorageCapacity', 0)
-        }
-        for fs in response['FileSystems']
-        if any(tag['Key'] == TAG_KEY and tag['Value'] == TAG_VALUE for tag in fs.get('Tags', []))
+    # Match the tag server-side so only tagged file systems are returned
+    paginator = tag_client.get_paginator('get_resources')
+    fs_ids = [
+        resource['ResourceARN'].split('/')[-1]
+        for page in paginator.paginate(
+            TagFilters=[{'Key': TAG_KEY, 'Values': [TAG_VALUE]}],
+            ResourceTypeFilters=['fsx:file-system']
+        )
+        for resource in page['ResourceTagMappingList']
     ]
+
+    # Keep the full file system descriptions so Step 4 can read endpoints without another API call
+    fs_by_id = {}
+    paginator = fsx_client.get_paginator('describe_file_systems')
+    for start in range(0, len(fs_ids), DESCRIBE_BATCH_SIZE):
+        batch_ids = fs_ids[start:start + DESCRIBE_BATCH_SIZE]
+        try:
+            described = [fs for page in paginator.paginate(FileSystemIds=batch_ids) for fs in page['FileSystems']]
+        except fsx_client.exceptions.FileSystemNotFound:
+            # The Tagging API can still list recently deleted file systems, so describe this batch
+            # one ID at a time and skip the ones that no longer exist
+            described = []
+            for fs_id in batch_ids:
+                try:
+                    described.extend(fsx_client.describe_file_systems(FileSystemIds=[fs_id])['FileSystems'])
+                except fsx_client.exceptions.FileSystemNotFound:
+                    log.warning("Skipping file system %s, which no longer exists", fs_id)
+        for fs in described:
+            if fs.get('FileSystemType') == 'ONTAP':
+                fs_by_id[fs['FileSystemId']] = fs
+    file_systems = list(fs_by_id.values())
 except ClientError as e:
-    print(f"Error retrieving file systems: {e}")
-    exit(1)
+    log.error("Error retrieving file systems: %s", e)
+    raise SystemExit(1)
 
 if not file_systems:
-    print(f"No FSx for ONTAP file systems found with tag {TAG_KEY}={TAG_VALUE} in region {AWS_REGION}")
-    exit(1)
+    log.error("No FSx for ONTAP file systems found with tag %s=%s in region %s", TAG_KEY, TAG_VALUE, AWS_REGION)
+    raise SystemExit(1)
+
+def get_capacity_percent(fs):
+    """Return the capacity utilization percentage of a file system description."""
+    consumed = fs.get('OntapConfiguration', {}).get('ConsumedStorageCapacity', 0)
+    total = fs.get('StorageCapacity', 0)
+    return (consumed / total * 100) if total != 0 else 0
 
 # Step 2: Find the least utilized file system based on TotalIops and capacity utilization
-print("Determining the least utilized file system (IOPS and capacity)...")
-lowest_score = float('inf')
-selected_fs_id = None
-selected_iops = 0
-selected_capacity_percent = 0
-
-# Collect IOPS and capacity data for normalization
-iops_values = []
-capacity_percent_values = []
-
-for fs in file_systems:
-    fs_id = fs['FileSystemId']
-    
-    # Get IOPS from CloudWatch
+log.info("Determining the least utilized file system (IOPS and capacity)...")
+
+if len(file_systems) == 1:
+    # Only one candidate, so skip CloudWatch and the scoring step entirely
+    selected_fs_id = file_systems[0]['FileSystemId']
+    selected_iops = 'N/A'
+    selected_capacity_percent = get_capacity_percent(file_systems[0])
+else:
+    # Preallocate IOPS and capacity utilization percentage arrays for normalization
+    n = len(file_systems)
+    iops = np.zeros(n)
+    cap = np.zeros(n)
+    for i, fs in enumerate(file_systems):
+        cap[i] = get_capacity_percent(fs)
+
+    # Get IOPS from CloudWatch, batching up to METRIC_DATA_BATCH_SIZE file systems per GetMetricData call
+    for start in range(0, len(file_systems), METRIC_DATA_BATCH_SIZE):
+        batch = file_systems[start:start + METRIC_DATA_BATCH_SIZE]
+        try:
+            response = cloudwatch_client.get_metric_data(
+                MetricDataQueries=[
+                    {
+                        'Id': f'm{i}',
+                        'MetricStat': {
+                            'Metric': {
+                                'Namespace': 'AWS/FSx',
+                                'MetricName': 'TotalIops',
+                                'Dimensions': [{'Name': 'FileSystemId', 'Value': fs['FileSystemId']}]
+                            },
+                            'Period': PERIOD,
+                            'Stat': 'Average'
+                        },
+                        'ReturnData': True
+                    }
+                    for i, fs in enumerate(batch)
+                ],
+                StartTime=START_TIME,
+                EndTime=END_TIME
+            )
+        except ClientError as e:
+            log.warning("Error retrieving IOPS for %s: %s", ', '.join(fs['FileSystemId'] for fs in batch), e)
+            continue
+        for result in response['MetricDataResults']:
+            if result['Values']:
+                iops[start + int(result['Id'][1:])] = result['Values'][0]
+
+    # Normalize IOPS and capacity to 0-1 scale (floor of 1 avoids division by zero)
+    scale_iops = max(iops.max(), 1.0)
+    scale_cap = max(cap.max(), 1.0)
+
+    # Evaluate combined utilization score and select the lowest
+    scores = IOPS_WEIGHT * (iops / scale_iops) + CAPACITY_WEIGHT * (cap / scale_cap)
+    idx = int(scores.argmin())
+    selected_fs_id = file_systems[idx]['FileSystemId']
+    selected_iops = float(iops[idx])
+    selected_capacity_percent = float(cap[idx])
+
+log.info("Selected file system: %s (Average IOPS: %s, Capacity Utilization: %.2f%%)", selected_fs_id, selected_iops, selected_capacity_percent)
+
+# Step 3: Get SVM details for the selected file system (served from the local cache when fresh)
+log.info("Retrieving details for SVM named %s in file system %s...", SVM_NAME, selected_fs_id)
+svm_cache_file = os.path.join(SVM_CACHE_DIR, f"{selected_fs_id}_{SVM_NAME}.json")
+svm_details = None
+try:
+    with open(svm_cache_file) as f:
+        cached = json.load(f)
+    if time.time() - cached['ts'] < SVM_CACHE_TTL:
+        svm_details = cached['svm']
+except (OSError, ValueError, KeyError):
+    pass
+
+if svm_details is None:
     try:
-        response = cloudwatch_client.get_metric_statistics(
-            Namespace='AWS/FSx',
-            MetricName='TotalIops',
-            Dimensions=[{'Name': 'FileSystemId', 'Value': fs_id}],
-            StartTime=START_TIME,
-            EndTime=END_TIME,
-            Period=PERIOD,
-            Statistics=['Average']
+        # The name filter is not supported everywhere, so match the SVM name client-side
+        paginator = fsx_client.get_paginator('describe_storage_virtual_machines')
+        svm_details = next(
+            (
+                svm
+                for page in paginator.paginate(Filters=[{'Name': 'file-system-id', 'Values': [selected_fs_id]}])
+                for svm in page['StorageVirtualMachines']
+                if svm['Name'] == SVM_NAME
+            ),
+            None
         )
-        iops = response['Datapoints'][0]['Average'] if response['Datapoints'] else 0
     except ClientError as e:
-        print(f"Error retrieving IOPS for {fs_id}: {e}")
-        iops = 0
-    iops_values.append(iops)
-
-    # Calculate capacity utilization percentage
-    consumed = fs['ConsumedStorageCapacity']
-    total = fs['StorageCapacity']
-    capacity_percent = (consumed / total * 100) if total != 0 else 0
-    capacity_percent_values.append(capacity_percent)
-
-# Normalize IOPS and capacity percentages
-max_iops = max(iops_values) if iops_values else 1
-max_capacity_percent = max(capacity_percent_values) if capacity_percent_values else 1
-max_iops = max(max_iops, 1)  # Avoid division by zero
-max_capacity_percent = max(max_capacity_percent, 1)  # Avoid division by zero
-
-# Evaluate combined utilization score
-for i, fs in enumerate(file_systems):
-    fs_id = fs['FileSystemId']
-    iops = iops_values[i]
-    capacity_percent = capacity_percent_values[i]
-
-    # Normalize IOPS and capacity to 0-1 scale
-    normalized_iops = iops / max_iops
-    normalized_capacity = capacity_percent / max_capacity_percent
-
-    # Calculate combined score
-    score = (IOPS_WEIGHT * normalized_iops) + (CAPACITY_WEIGHT * normalized_capacity)
-
-    # Update if score is lower
-    if score < lowest_score:
-        lowest_score = score
-        selected_fs_id = fs_id
-        selected_iops = iops
-        selected_capacity_percent = capacity_percent
-
-if not selected_fs_id:
-    print("Failed to determine the least utilized file system")
-    exit(1)
-
-print(f"Selected file system: {selected_fs_id} (Average IOPS: {selected_iops}, Capacity Utilization: {selected_capacity_percent:.2f}%)")
-
-# Step 3: Get SVM details for the selected file system
-print(f"Retrieving details for SVM named {SVM_NAME} in file system {selected_fs_id}...")
-try:
-    response = fsx_client.describe_storage_virtual_machines(
-        Filters=[
-            {'Name': 'file-system-id', 'Values': [selected_fs_id]},
-            {'Name': 'name', 'Values': [SVM_NAME]}
-        ]
-    )
-    svm_details = response['StorageVirtualMachines'][0] if response['StorageVirtualMachines'] else None
-except ClientError as e:
-    print(f"Error retrieving SVM details: {e}")
-    exit(1)
+        log.error("Error retrieving SVM details: %s", e)
+        raise SystemExit(1)
 
-if not svm_details or svm_details['Name'] != SVM_NAME:
-    print(f"SVM named '{SVM_NAME}' not found in file system {selected_fs_id}")
-    exit(1)
+    if svm_details:
+        try:
+            os.makedirs(SVM_CACHE_DIR, exist_ok=True)
+            with open(svm_cache_file, 'w') as f:
+                json.dump({'ts': time.time(), 'svm': svm_details}, f, default=str)
+        except OSError as e:
+            log.warning("Could not write SVM cache %s: %s", svm_cache_file, e)
+
+if not svm_details:
+    log.error("SVM named '%s' not found in file system %s", SVM_NAME, selected_fs_id)
+    raise SystemExit(1)
 
 # Step 4: Extract IPs
 try:
-    fs_response = fsx_client.describe_file_systems(FileSystemIds=[selected_fs_id])
-    management_ip = fs_response['FileSystems'][0]['OntapConfiguration']['Endpoints']['Management']['IpAddresses'][0]
-    intercluster_ips = ', '.join(fs_response['FileSystems'][0]['OntapConfiguration']['Endpoints']['InterCluster']['IpAddresses'])
+    fs_obj = fs_by_id[selected_fs_id]
+    management_ip = fs_obj['OntapConfiguration']['Endpoints']['Management']['IpAddresses'][0]
+    intercluster_ips = ', '.join(fs_obj['OntapConfiguration']['Endpoints']['InterCluster']['IpAddresses'])
     iscsi_ips = ', '.join(svm_details['Endpoints']['Iscsi']['IpAddresses'])
-except ClientError as e:
-    print(f"Error retrieving IPs: {e}")
-    exit(1)
+except (KeyError, IndexError) as e:
+    log.error("Error retrieving IPs: %s", e)
+    raise SystemExit(1)
 
 # Step 5: Output results
 output = f"""Results for SVM '{SVM_NAME}' in File System '{selected_fs_id}':
@@ -155,4 +213,4 @@ with open(OUTPUT_FILE, 'w') as f:
 
 # Print to console
 print(output)
-print(f"Results saved to {OUTPUT_FILE}")
\ No newline at end of file
+log.info("Results saved to %s", OUTPUT_FILE)
\ No newline at end of file
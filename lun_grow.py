@@ -1,70 +1,115 @@
-import requests
-import urllib3
+import asyncio
+import functools
+import logging
+import time
+import httpx
 import argparse
+import os
 
-# Disable SSL warnings for simplicity (not recommended for production)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
 
-def send_request(method: str, url: str, auth: tuple, data: dict = None) -> dict:
-    headers = {"Accept": "application/json"}
+# httpx only supports HTTP/2 when the optional h2 package (httpx[http2]) is installed
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+log = logging.getLogger(__name__)
+
+# ONTAP REST query operators; a name containing one could match more than one record
+QUERY_METACHARACTERS = ("*", "|", "!", "<", ">", "..")
+
+def check_query_value(kind: str, value: str) -> None:
+    if any(c in value for c in QUERY_METACHARACTERS):
+        log.error("%s %s contains ONTAP query characters %s", kind, value, " ".join(QUERY_METACHARACTERS))
+        raise SystemExit(1)
+
+async def send_request(client: httpx.AsyncClient, method: str, url: str, data: dict = None, params: dict = None) -> dict:
     try:
-        response = requests.request(
-            method,
-            url,
-            auth=auth,
-            headers=headers,
-            json=data,
-            verify=False
-        )
+        response = await client.request(method, url, json=data, params=params)
         response.raise_for_status()
-        return response.json(), response.status_code
-    except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error: {e.response.status_code} - {e.response.reason}")
-        exit(1)
-    except requests.exceptions.RequestException as e:
-        print(f"Request Error: {str(e)}")
-        exit(1)
-
-def get_volume(cluster: str, vserver: str, vol_name: str, auth: tuple) -> dict:
-    url = f"https://{cluster}/api/storage/volumes?name={vol_name}&svm.name={vserver}&fields=size"
-    response, status_code = send_request("GET", url, auth)
-    volumes = response.get("records", [])
-    if not volumes:
-        print(f"Error: Volume {vol_name} not found in SVM {vserver} (Status: {status_code})")
-        exit(1)
-    return volumes[0], status_code
-
-def modify_volume_size(cluster: str, vserver: str, vol_name: str, new_size: int, auth: tuple) -> dict:
-    volume, _ = get_volume(cluster, vserver, vol_name, auth)
-    volume_uuid = volume["uuid"]
-    url = f"https://{cluster}/api/storage/volumes/{volume_uuid}"
+        return _json.loads(response.content), response.status_code
+    except httpx.HTTPStatusError as e:
+        log.error("HTTP Error: %s - %s", e.response.status_code, e.response.reason_phrase)
+        raise SystemExit(1)
+    except httpx.RequestError as e:
+        log.error("Request Error: %s", e)
+        raise SystemExit(1)
+
+async def modify_volume_size(client: httpx.AsyncClient, vserver: str, vol_name: str, new_size: int) -> dict:
+    # Collection-level PATCH filtered by name/SVM avoids a separate GET to look up the volume UUID
+    check_query_value("Volume", vol_name)
+    check_query_value("SVM", vserver)
+    url = "/api/storage/volumes"
+    params = {"name": vol_name, "svm.name": vserver}
     data = {"size": new_size}
-    response, status_code = send_request("PATCH", url, auth, data)
+    response, status_code = await send_request(client, "PATCH", url, data, params)
+    if response.get("num_records") != 1:
+        log.error("Expected one volume %s in SVM %s, matched %s (Status: %s)", vol_name, vserver, response.get("num_records"), status_code)
+        raise SystemExit(1)
     return response, status_code
 
-def get_lun(cluster: str, vserver: str, lun_path: str, auth: tuple) -> dict:
-    url = f"https://{cluster}/api/storage/luns?name={lun_path}&svm.name={vserver}&fields=space.size"
-    response, status_code = send_request("GET", url, auth)
-    luns = response.get("records", [])
-    if not luns:
-        print(f"Error: LUN {lun_path} not found in SVM {vserver} (Status: {status_code})")
-        exit(1)
-    return luns[0], status_code
-
-def resize_lun(cluster: str, vserver: str, lun_path: str, new_size: int, auth: tuple) -> dict:
-    lun, _ = get_lun(cluster, vserver, lun_path, auth)
-    lun_uuid = lun["uuid"]
-    url = f"https://{cluster}/api/storage/luns/{lun_uuid}"
+async def resize_lun(client: httpx.AsyncClient, vserver: str, lun_path: str, new_size: int) -> dict:
+    # Collection-level PATCH filtered by name/SVM avoids a separate GET to look up the LUN UUID
+    check_query_value("LUN", lun_path)
+    check_query_value("SVM", vserver)
+    url = "/api/storage/luns"
+    params = {"name": lun_path, "svm.name": vserver}
     data = {"space": {"size": new_size}}
-    response, status_code = send_request("PATCH", url, auth, data)
+    response, status_code = await send_request(client, "PATCH", url, data, params)
+    if response.get("num_records") != 1:
+        log.error("Expected one LUN %s in SVM %s, matched %s (Status: %s)", lun_path, vserver, response.get("num_records"), status_code)
+        raise SystemExit(1)
     return response, status_code
 
-def calculate_sizes(volume_size: int) -> tuple:
-    # Apply 5% overhead to volume size for LUN
-    lun_size = int(volume_size * 0.95)
-    return volume_size, lun_size
+async def wait_jobs(client: httpx.AsyncClient, response: dict, timeout: int = 60) -> None:
+    """Wait, with exponential backoff, for any asynchronous jobs returned by a PATCH to succeed."""
+    jobs = response.get("jobs") or ([response["job"]] if "job" in response else [])
+    for job in jobs:
+        href = job["_links"]["self"]["href"]
+        delay = 0.1
+        deadline = time.monotonic() + timeout
+        while True:
+            job_response, _ = await send_request(client, "GET", href)
+            state = job_response.get("state")
+            if state == "success":
+                break
+            if state == "failure":
+                log.error("Job %s failed: %s", href, job_response.get("message"))
+                raise SystemExit(1)
+            if time.monotonic() >= deadline:
+                log.error("Job %s did not finish within %s seconds", href, timeout)
+                raise SystemExit(1)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
 
-def main():
+async def amain(args: argparse.Namespace, volume_size: int, lun_size: int) -> None:
+    # One HTTP/2 client carries every request over a single TLS connection
+    # (SSL verification disabled for simplicity, not recommended for production)
+    async with httpx.AsyncClient(
+        base_url=f"https://{args.cluster}",
+        auth=(args.username, args.password),
+        headers={"Accept": "application/hal+json"},
+        verify=False,
+        http2=HTTP2_AVAILABLE
+    ) as client:
+        # The LUN lives inside the volume, so the volume must finish growing before the LUN is resized
+        log.info("Modifying volume %s to size %d bytes", args.volume, volume_size)
+        vol_response, vol_status = await modify_volume_size(client, args.vserver, args.volume, volume_size)
+        await wait_jobs(client, vol_response)
+        log.info("Volume modification successful: Status %s", vol_status)
+
+        log.info("Resizing LUN %s to size %d bytes", args.lun_path, lun_size)
+        lun_response, lun_status = await resize_lun(client, args.vserver, args.lun_path, lun_size)
+        await wait_jobs(client, lun_response)
+        log.info("LUN resize successful: Status %s", lun_status)
+
+@functools.cache
+def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="ONTAP Volume and LUN Resize Script")
     parser.add_argument("--cluster", required=True, help="ONTAP cluster management IP")
     parser.add_argument("--vserver", required=True, help="SVM name")
@@ -72,28 +117,28 @@ def main():
     parser.add_argument("--lun-path", required=True, help="LUN path (e.g., /vol/vol1/lun1)")
     parser.add_argument("--size", required=True, type=int, help="New volume size in bytes")
     parser.add_argument("--username", required=True, help="ONTAP admin username")
-    parser.add_argument("--password", required=True, help="ONTAP admin password")
-    
-    args = parser.parse_args()
-    auth = (args.username, args.password)
+    parser.add_argument("--password", help="ONTAP admin password (defaults to the ONTAP_PASSWORD environment variable)")
+    return parser
+
+def main(argv: list = None):
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    # Read the environment at call time so the cached parser never holds a password
+    args.password = args.password or os.environ.get("ONTAP_PASSWORD")
+    if not args.password:
+        parser.error("--password is required unless ONTAP_PASSWORD is set")
 
     try:
-        # Calculate sizes
-        volume_size, lun_size = calculate_sizes(args.size)
-        
-        # Modify volume size
-        print(f"Modifying volume {args.volume} to size {volume_size} bytes")
-        vol_response, vol_status = modify_volume_size(args.cluster, args.vserver, args.volume, volume_size, auth)
-        print(f"Volume modification successful: Status {vol_status}")
-
-        # Resize LUN
-        print(f"Resizing LUN {args.lun_path} to size {lun_size} bytes")
-        lun_response, lun_status = resize_lun(args.cluster, args.vserver, args.lun_path, lun_size, auth)
-        print(f"LUN resize successful: Status {lun_status}")
+        # Apply 5% overhead to volume size for LUN
+        volume_size = args.size
+        lun_size = (args.size * 95) // 100
+
+        asyncio.run(amain(args, volume_size, lun_size))
 
     except Exception as e:
-        print(f"Error: {str(e)}")
-        exit(1)
+        log.error("Error: %s", e)
+        raise SystemExit(1)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
\ No newline at end of file
@@ -1,12 +1,22 @@
 import requests
-import base64
 import json
+import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib3.exceptions import InsecureRequestWarning
 
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+
 # Suppress SSL warnings (use only for testing; enable SSL verification in production)
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
+log = logging.getLogger(__name__)
+
 # Configuration for source and destination FSx for ONTAP clusters
 source_cluster = {
     "hostname": "management.fs-XXXXXXXX.fsx.us-east-1.amazonaws.com",  # Replace with source FSx management endpoint
@@ -33,16 +43,20 @@ destination_svm_name = "svm_destination"  # Replace with your destination SVM na
 # Cluster peer passphrase (must be the same for both clusters)
 passphrase = "your_cluster_peer_passphrase"  # Replace with a secure passphrase
 
-def get_auth_headers(cluster):
-    """Generate HTTP Basic Authentication headers."""
-    auth_str = f"{cluster['username']}:{cluster['password']}"
-    auth_encoded = base64.b64encode(auth_str.encode()).decode()
-    return {"Authorization": f"Basic {auth_encoded}", "Content-Type": "application/json"}
+def get_session(cluster):
+    """Return the cluster's authenticated HTTP session, creating it on first use."""
+    session = cluster.get("_session")
+    if session is None:
+        session = requests.Session()
+        session.auth = (cluster["username"], cluster["password"])
+        session.verify = cluster["verify_ssl"]
+        session.headers["Content-Type"] = "application/json"
+        cluster["_session"] = session
+    return session
 
 def create_cluster_peer(cluster, remote_lifs, peer_name, passphrase, is_source=True):
     """Create a cluster peering relationship."""
-    url = f"https://{cluster['hostname']}/api/cluster/peers"
-    headers = get_auth_headers(cluster)
+    url = f"https://{cluster['hostname']}/api/cluster/peers?return_records=true"
     
     # Construct the payload for cluster peering
     payload = {
@@ -53,21 +67,60 @@ def create_cluster_peer(cluster, remote_lifs, peer_name, passphrase, is_source=T
     }
     
     try:
-        response = requests.post(url, headers=headers, json=payload, verify=cluster["verify_ssl"])
+        response = get_session(cluster).post(url, data=_dumps(payload))
         response.raise_for_status()
-        print(f"Cluster peer created on {'source' if is_source else 'destination'} cluster: {peer_name}")
+        log.info("Cluster peer created on %s cluster: %s", 'source' if is_source else 'destination', peer_name)
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error creating cluster peer on {'source' if is_source else 'destination'} cluster: {e}")
+        log.error("Error creating cluster peer on %s cluster: %s", 'source' if is_source else 'destination', e)
         if response.text:
-            print(f"Response details: {response.text}")
+            log.error("Response details: %s", response.text)
         raise
 
+def poll_with_backoff(cluster, url, is_done, timeout=60):
+    """GET a URL with exponential backoff until is_done(body) is true and return that body."""
+    delay = 0.1
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = get_session(cluster).get(url)
+        response.raise_for_status()
+        body = response.json()
+        if is_done(body):
+            return body
+        time.sleep(delay)
+        delay = min(delay * 2, 2.0)
+    raise TimeoutError(f"{url} did not reach the expected state within {timeout} seconds")
+
+def wait_job(cluster, href, timeout=60):
+    """Poll an asynchronous ONTAP job until it finishes and return its final state."""
+    url = f"https://{cluster['hostname']}{href}"
+    body = poll_with_backoff(cluster, url, lambda b: b.get("state") in ("success", "failure"), timeout)
+    return body["state"]
+
+def get_cluster_peer_uuid(cluster, peer_name):
+    """Look up the UUID of a cluster peer by name."""
+    url = f"https://{cluster['hostname']}/api/cluster/peers"
+    response = get_session(cluster).get(url, params={"name": peer_name, "fields": "uuid"})
+    response.raise_for_status()
+    records = response.json().get("records", [])
+    if not records:
+        raise RuntimeError(f"Cluster peer {peer_name} not found on {cluster['hostname']}")
+    return records[0]["uuid"]
+
+def wait_for_cluster_peer(cluster, peer_uuid, timeout=60):
+    """Poll a cluster peer until it reports an available or peered state."""
+    url = f"https://{cluster['hostname']}/api/cluster/peers/{peer_uuid}?fields=status"
+    body = poll_with_backoff(
+        cluster, url, lambda b: b.get("status", {}).get("state") in ("available", "peered"), timeout
+    )
+    state = body["status"]["state"]
+    log.info("Cluster peer %s is %s.", peer_uuid, state)
+    return state
+
 def create_svm_peer(source_cluster, dest_cluster, source_svm, dest_svm):
     """Create and accept an SVM peering relationship."""
     # Step 1: Initiate SVM peering from source cluster
     url = f"https://{source_cluster['hostname']}/api/svm/peers"
-    headers = get_auth_headers(source_cluster)
     
     payload = {
         "svm": {"name": source_svm},
@@ -76,18 +129,17 @@ def create_svm_peer(source_cluster, dest_cluster, source_svm, dest_svm):
     }
     
     try:
-        response = requests.post(url, headers=headers, json=payload, verify=source_cluster["verify_ssl"])
+        response = get_session(source_cluster).post(url, data=_dumps(payload))
         response.raise_for_status()
-        print(f"SVM peering initiated for {source_svm} to {dest_svm}.")
+        log.info("SVM peering initiated for %s to %s.", source_svm, dest_svm)
     except requests.exceptions.RequestException as e:
-        print(f"Error initiating SVM peering: {e}")
+        log.error("Error initiating SVM peering: %s", e)
         if response.text:
-            print(f"Response details: {response.text}")
+            log.error("Response details: %s", response.text)
         raise
     
     # Step 2: Accept SVM peering on destination cluster
     url = f"https://{dest_cluster['hostname']}/api/svm/peers"
-    headers = get_auth_headers(dest_cluster)
     
     payload = {
         "svm": {"name": dest_svm},
@@ -95,30 +147,46 @@ def create_svm_peer(source_cluster, dest_cluster, source_svm, dest_svm):
     }
     
     try:
-        response = requests.post(url, headers=headers, json=payload, verify=dest_cluster["verify_ssl"])
+        response = get_session(dest_cluster).post(url, data=_dumps(payload))
         response.raise_for_status()
-        print(f"SVM peering accepted for {dest_svm} to {source_svm}.")
+        log.info("SVM peering accepted for %s to %s.", dest_svm, source_svm)
     except requests.exceptions.RequestException as e:
-        print(f"Error accepting SVM peering: {e}")
+        log.error("Error accepting SVM peering: %s", e)
         if response.text:
-            print(f"Response details: {response.text}")
+            log.error("Response details: %s", response.text)
         raise
 
 def main():
     try:
-        # Create cluster peering on source and destination
-        create_cluster_peer(source_cluster, destination_intercluster_lifs, "dest_cluster", passphrase, is_source=True)
-        time.sleep(5)  # Allow time for cluster peer to establish
-        create_cluster_peer(destination_cluster, source_intercluster_lifs, "source_cluster", passphrase, is_source=False)
+        # Create cluster peering on source and destination concurrently
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            source_future = ex.submit(create_cluster_peer, source_cluster, destination_intercluster_lifs, "dest_cluster", passphrase, True)
+            dest_future = ex.submit(create_cluster_peer, destination_cluster, source_intercluster_lifs, "source_cluster", passphrase, False)
+            source_peer = source_future.result()
+            dest_peer = dest_future.result()
+        
+        # Wait for any asynchronous peer-creation jobs to finish
+        for cluster, peer in ((source_cluster, source_peer), (destination_cluster, dest_peer)):
+            job = peer.get("job")
+            if job and wait_job(cluster, job["_links"]["self"]["href"]) != "success":
+                raise RuntimeError(f"Cluster peer job failed on {cluster['hostname']}")
+        
+        # A job-only POST response carries no records, so look the peer up by name in that case
+        if source_peer.get("records"):
+            source_peer_uuid = source_peer["records"][0]["uuid"]
+        else:
+            source_peer_uuid = get_cluster_peer_uuid(source_cluster, "dest_cluster")
         
-        # Create SVM peering
-        time.sleep(5)  # Wait for cluster peering to stabilize
+        # Create SVM peering once the cluster peer is available
+        wait_for_cluster_peer(source_cluster, source_peer_uuid)
         create_svm_peer(source_cluster, destination_cluster, source_svm_name, destination_svm_name)
         
-        print("Cluster and SVM peering successfully established.")
+        log.info("Cluster and SVM peering successfully established.")
         
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.error("An error occurred: %s", e)
+        raise SystemExit(1)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
\ No newline at end of file